@@ -1,44 +1,93 @@
-import json
+import asyncio
 import os
+import queue
+import threading
 import time
 import traceback
+from collections import Counter, namedtuple
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 
 import uvicorn
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+from cachetools import TTLCache
 from fastapi import FastAPI, HTTPException, Request, Depends, Response
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, HttpUrl
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, func, select, ForeignKey, and_
+from sqlalchemy import create_engine, event, Column, Integer, String, DateTime, func, select, insert, update, delete, text, bindparam, ForeignKey
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker, Session, declarative_base
+from sqlalchemy.pool import QueuePool
 from datetime import datetime, timedelta
 import hashlib
+import hmac
 import secrets
-from fastapi.responses import RedirectResponse
+from fastapi.responses import ORJSONResponse, RedirectResponse
 
 # Database setup
 DATABASE_URL = "sqlite:///./shortener.db"
+DB_POOL_SIZE = 10
+DB_POOL_MAX_OVERFLOW = 20
+DB_POOL_TIMEOUT = 30  # seconds
 Base = declarative_base()
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# Each concurrent session gets its own connection so reads run in parallel under WAL;
+# writes are serialized on the db_writer() thread
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=QueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_POOL_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    query_cache_size=1024,
+)
+
+@event.listens_for(engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # Only takes effect on a new database; lets purge_expired_urls() reclaim freed pages
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.execute("PRAGMA cache_size=-20000")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 BASE_URL = "https://short.ly/"
 HOST = os.getenv("HOST","localhost")
 PORT = int(os.getenv("PORT","3500"))
+SHORT_URL_MAX_ATTEMPTS = 10
+URL_CACHE_SIZE = 100_000
+URL_CACHE_TTL = 3600  # seconds
+VERIFIED_PASSWORD_CACHE_SIZE = 10_000
+VERIFIED_PASSWORD_CACHE_TTL = 60  # seconds
+WRITE_BATCH_SIZE = 500
+WRITE_BATCH_WINDOW = 0.005  # seconds
+WRITE_TIMEOUT = 30  # seconds
+DB_OPTIMIZE_INTERVAL = 3600  # seconds
+EXPIRED_URL_PURGE_INTERVAL = 900  # seconds
 
 # Models
 class URL(Base):
     __tablename__ = "urls"
 
     id = Column(Integer, primary_key=True, index=True)
-    original_url = Column(String, nullable=False)
-    shortened_url = Column(String, unique=True, nullable=False)
+    original_url = Column(String, unique=True, index=True, nullable=False)
+    short_hash = Column(String(12), unique=True, index=True, nullable=False)
     creation_time = Column(DateTime, default=datetime.utcnow)
     expiration_time = Column(DateTime, nullable=False)
-    access_count = Column(Integer, default=0)
+    access_count = Column(Integer, default=0, server_default="0", nullable=False)
     password_hash = Column(String, nullable=True)
 
 class AccessLog(Base):
     __tablename__ = "access_logs"
 
     id = Column(Integer, primary_key=True, index=True)
-    url_id = Column(Integer, ForeignKey(URL.id), nullable=False)
+    url_id = Column(Integer, ForeignKey(URL.id), index=True, nullable=False)
     timestamp = Column(DateTime, default=datetime.utcnow)
     ip_address = Column(String, nullable=False)
 
@@ -53,11 +102,45 @@ class AnalyticsResponse(BaseModel):
     access_count: int
     access_logs: list
 
+# Built once so the per-request lookups reuse the same compiled statements. They select
+# plain columns rather than URL entities to skip ORM object loading on the hot path.
+redirect_target_by_short_hash = (
+    select(URL.id, URL.original_url, URL.expiration_time, URL.password_hash)
+    .where(URL.short_hash == bindparam("short_hash"))
+)
+analytics_url_by_short_hash = (
+    select(URL.id, URL.original_url, URL.access_count)
+    .where(URL.short_hash == bindparam("short_hash"))
+)
+increment_access_count = (
+    update(URL)
+    .where(URL.id == bindparam("url_id"))
+    .values(access_count=URL.access_count + bindparam("hits"))
+)
+
 # FastAPI app
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 Base.metadata.create_all(bind=engine)
 
+# create_all() only creates missing tables, so migrate existing databases here
+def migrate_database():
+    with engine.begin() as connection:
+        columns = {row[1] for row in connection.execute(text("PRAGMA table_info(urls)"))}
+        if "shortened_url" in columns:
+            # Older databases stored BASE_URL + hash; keep only the hash. The existing
+            # unique index follows the renamed column.
+            connection.execute(text("ALTER TABLE urls RENAME COLUMN shortened_url TO short_hash"))
+            connection.execute(
+                text("UPDATE urls SET short_hash = substr(short_hash, :start) WHERE short_hash LIKE :prefix"),
+                {"start": len(BASE_URL) + 1, "prefix": BASE_URL + "%"}
+            )
+        connection.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_urls_original_url ON urls (original_url)"))
+        connection.execute(text("CREATE INDEX IF NOT EXISTS ix_access_logs_url_id ON access_logs (url_id)"))
+        connection.execute(text("ANALYZE"))
+
+migrate_database()
+
 # Dependency to get the database session
 def get_db():
     db = SessionLocal()
@@ -66,41 +149,262 @@ def get_db():
     finally:
         db.close()
 
+# SQLite allows a single writer, so every write runs on one thread that owns its own
+# session. Access logs are fire-and-forget; other writes wait for their result.
+write_queue = queue.Queue()
+db_writer_thread = None
+
+def log_access(url_id: int, ip_address: str, timestamp: datetime):
+    write_queue.put_nowait(("log", (url_id, ip_address, timestamp), None))
+
+# Runs job(db, *args) on the writer thread and returns its result
+def submit_write(job, *args):
+    if db_writer_thread is None or not db_writer_thread.is_alive():
+        raise RuntimeError("Database writer thread is not running")
+    future = Future()
+    write_queue.put_nowait(("call", (job, args), future))
+    try:
+        return future.result(timeout=WRITE_TIMEOUT)
+    except FutureTimeoutError:
+        raise RuntimeError("Timed out waiting for the database writer thread")
+
+def fail_pending_writes():
+    while True:
+        try:
+            kind, _, future = write_queue.get_nowait()
+        except queue.Empty:
+            return
+        if kind == "call":
+            future.set_exception(RuntimeError("Database writer thread has stopped"))
+
+def write_access_logs(db: Session, access_logs: list):
+    rows = [
+        {"url_id": url_id, "ip_address": ip_address, "timestamp": timestamp}
+        for url_id, ip_address, timestamp in access_logs
+    ]
+    try:
+        db.execute(insert(AccessLog), rows)
+        hits = Counter(row["url_id"] for row in rows)
+        # Run on the Connection: Session.execute() would treat a parameter list as an ORM bulk update by primary key
+        db.connection().execute(
+            increment_access_count,
+            [{"url_id": url_id, "hits": count} for url_id, count in hits.items()]
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        traceback.print_exc()
+
+def next_write_batch() -> list:
+    # Sleep until there is work, then collect whatever else arrives within the batch window
+    batch = [write_queue.get()]
+    deadline = time.monotonic() + WRITE_BATCH_WINDOW
+    while len(batch) < WRITE_BATCH_SIZE and batch[-1][0] != "stop":
+        try:
+            batch.append(write_queue.get(timeout=max(deadline - time.monotonic(), 0)))
+        except queue.Empty:
+            break
+    return batch
+
+def db_writer():
+    db = SessionLocal()
+    try:
+        stopping = False
+        while not stopping:
+            batch = next_write_batch()
+            stopping = batch[-1][0] == "stop"
+            access_logs = [payload for kind, payload, _ in batch if kind == "log"]
+            if access_logs:
+                write_access_logs(db, access_logs)
+            for kind, payload, future in batch:
+                if kind != "call":
+                    continue
+                job, args = payload
+                try:
+                    result = job(db, *args)
+                except Exception as e:
+                    db.rollback()
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+    finally:
+        db.close()
+        # Anything submitted after the stop item would otherwise wait forever
+        fail_pending_writes()
+
+@app.on_event("startup")
+def start_db_writer():
+    global db_writer_thread
+    db_writer_thread = threading.Thread(target=db_writer, daemon=True)
+    db_writer_thread.start()
+
+# Called from stop_background_tasks() so periodic jobs can't submit to a stopped writer
+def stop_db_writer():
+    if db_writer_thread is not None:
+        # Queued behind any pending writes, so those are flushed before the thread exits
+        write_queue.put_nowait(("stop", None, None))
+        db_writer_thread.join()
+
+# Short URL -> URL row cache for the redirect path; everything cached is immutable
+CachedURL = namedtuple("CachedURL", ["id", "original_url", "expiration_time", "password_hash"])
+url_cache = TTLCache(maxsize=URL_CACHE_SIZE, ttl=URL_CACHE_TTL)
+url_cache_lock = threading.Lock()
+
+def get_cached_url(short_url: str, db: Session):
+    with url_cache_lock:
+        url_entry = url_cache.get(short_url)
+    if url_entry is not None:
+        return url_entry
+
+    row = db.execute(redirect_target_by_short_hash, {"short_hash": short_url}).first()
+    if not row:
+        return None
+    url_entry = CachedURL(*row)
+    with url_cache_lock:
+        url_cache[short_url] = url_entry
+    return url_entry
+
+# Periodic database maintenance, run off the event loop
+background_tasks = []
+
+def run_optimize(db: Session):
+    # Keep the query planner statistics from ANALYZE up to date as the tables grow
+    db.execute(text("PRAGMA optimize"))
+    db.commit()
+
+def optimize_database():
+    submit_write(run_optimize)
+
+def delete_expired_urls(db: Session) -> list:
+    now = datetime.utcnow()
+    expired_urls = db.execute(
+        select(URL.short_hash).where(URL.expiration_time < now)
+    ).scalars().all()
+    if not expired_urls:
+        return expired_urls
+    db.execute(
+        delete(AccessLog).where(
+            AccessLog.url_id.in_(select(URL.id).where(URL.expiration_time < now))
+        )
+    )
+    db.execute(delete(URL).where(URL.expiration_time < now))
+    db.commit()
+    # sqlite3's execute() steps a no-result statement only once, freeing a single page;
+    # executescript() runs incremental_vacuum to completion
+    db.connection().connection.driver_connection.executescript("PRAGMA incremental_vacuum")
+    db.commit()
+    return expired_urls
+
+def purge_expired_urls():
+    expired_urls = submit_write(delete_expired_urls)
+    # A purged URL may be shortened again, so don't keep serving the old row
+    with url_cache_lock:
+        for short_hash in expired_urls:
+            url_cache.pop(short_hash, None)
+
+async def run_periodically(interval: float, job):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_threadpool(job)
+        except Exception:
+            traceback.print_exc()
+
+@app.on_event("startup")
+async def start_background_tasks():
+    background_tasks.append(asyncio.create_task(run_periodically(DB_OPTIMIZE_INTERVAL, optimize_database)))
+    background_tasks.append(asyncio.create_task(run_periodically(EXPIRED_URL_PURGE_INTERVAL, purge_expired_urls)))
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    for task in background_tasks:
+        task.cancel()
+    # A job already running in the threadpool finishes first, and it may still need the writer
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    await run_in_threadpool(stop_db_writer)
+
 # Helper functions
-def get_current_date_time():
-    return time.strftime('%Y-%m-%d %H:%M:%S')
+def generate_short_hash(original_url: str, attempt: int = 0) -> str:
+    # Salt with the attempt number so a colliding hash can be retried
+    key = f"{original_url}#{attempt}" if attempt else original_url
+    return hashlib.blake2b(key.encode(), digest_size=4).hexdigest()
 
-def generate_short_url(original_url: str) -> str:
-    hash_object = hashlib.sha256(original_url.encode())
-    short_hash = hash_object.hexdigest()[:6]
-    return BASE_URL + short_hash
+password_hasher = PasswordHasher()
+
+# Argon2 is slow by design, so remember recently verified passwords. Entries are keyed
+# by the stored (salted) hash, so a re-created short URL with a new password never matches.
+verified_password_cache = TTLCache(maxsize=VERIFIED_PASSWORD_CACHE_SIZE, ttl=VERIFIED_PASSWORD_CACHE_TTL)
+verified_password_cache_lock = threading.Lock()
 
 def hash_password(password: str) -> str:
     if not password:
         return None
-    return hashlib.sha256(password.encode()).hexdigest()
+    return password_hasher.hash(password)
+
+def verify_password(password_hash: str, password: str) -> bool:
+    # Hashes stored before the switch to Argon2 are unsalted SHA-256
+    if not password_hash.startswith("$argon2"):
+        return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), password_hash)
+    try:
+        return password_hasher.verify(password_hash, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+def check_url_password(password_hash: str, password: str) -> bool:
+    key = (password_hash, hashlib.sha256(password.encode()).hexdigest())
+    with verified_password_cache_lock:
+        if key in verified_password_cache:
+            return True
+    if not verify_password(password_hash, password):
+        return False
+    with verified_password_cache_lock:
+        verified_password_cache[key] = True
+    return True
+
+def insert_url(db: Session, original_url: str, expiration_time: datetime, password_hash: str) -> str:
+    for attempt in range(SHORT_URL_MAX_ATTEMPTS):
+        stmt = (
+            sqlite_insert(URL)
+            .values(
+                original_url=original_url,
+                short_hash=generate_short_hash(original_url, attempt),
+                expiration_time=expiration_time,
+                password_hash=password_hash
+            )
+            .on_conflict_do_nothing(index_elements=["original_url"])
+            .returning(URL.short_hash)
+        )
+        try:
+            short_hash = db.execute(stmt).scalar_one_or_none()
+            db.commit()
+        except IntegrityError:
+            # short_hash collided with a different original URL
+            db.rollback()
+            continue
+        if short_hash is None:
+            short_hash = db.execute(
+                select(URL.short_hash).where(URL.original_url == original_url)
+            ).scalar_one()
+        return short_hash
+    return None
 
 @app.post("/shorten")
-def shorten_url(request: URLRequest, db: Session = Depends(get_db)):
+def shorten_url(request: URLRequest):
     try:
         original_url = str(request.original_url)
-        short_url = generate_short_url(original_url)
         expiration_time = datetime.utcnow() + timedelta(hours=request.expiration_hours)
         password_hash = hash_password(request.password)
 
-        existing_url = db.query(URL).filter(URL.original_url == str(request.original_url)).first()
-        if existing_url:
-            return {"shortened_url": existing_url.shortened_url}
-        new_url = URL(
-            original_url=original_url,
-            shortened_url=short_url,
-            expiration_time=expiration_time,
-            password_hash=password_hash
-        )
-        db.add(new_url)
-        db.commit()
-        db.refresh(new_url)
-        return {"shortened_url": short_url}
+        try:
+            short_hash = submit_write(insert_url, original_url, expiration_time, password_hash)
+        except RuntimeError:
+            raise HTTPException(status_code=503, detail="Database writer is unavailable")
+        if short_hash is None:
+            raise HTTPException(status_code=500, detail="Could not generate a unique short URL")
+        return {"shortened_url": BASE_URL + short_hash}
+    except HTTPException:
+        raise
     except Exception as e:
         print(e)
 
@@ -112,25 +416,18 @@ def redirect_url(
     db: Session = Depends(get_db)
 ):
     try:
-
-        full_url = BASE_URL + short_url
-        url_entry = db.query(URL).filter(URL.shortened_url == full_url).first()
+        url_entry = get_cached_url(short_url, db)
         if not url_entry:
             raise HTTPException(status_code=404, detail="URL not found")
-        if url_entry.expiration_time < datetime.utcnow():
+        now = datetime.utcnow()
+        if url_entry.expiration_time < now:
             raise HTTPException(status_code=410, detail="URL has expired")
         if url_entry.password_hash:
             if not password:
                 raise HTTPException(status_code=401, detail="Password required")
-            if hash_password(password) != url_entry.password_hash:
+            if not check_url_password(url_entry.password_hash, password):
                 raise HTTPException(status_code=403, detail="Incorrect password")
-        access_log = AccessLog(
-            url_id=url_entry.id,
-            ip_address=request.client.host
-        )
-        db.add(access_log)
-        url_entry.access_count += 1
-        db.commit()
+        log_access(url_entry.id, request.client.host, now)
 
         return {"redirect_to": url_entry.original_url}
     except Exception as e:
@@ -139,29 +436,25 @@ def redirect_url(
 @app.get("/analytics/{short_url}")
 def get_analytics(short_url: str, db: Session = Depends(get_db)):
     try:
-        full_url = BASE_URL + short_url
-        url_entry = db.query(URL).filter(URL.shortened_url == full_url).first()
+        url_entry = db.execute(analytics_url_by_short_hash, {"short_hash": short_url}).first()
         if not url_entry:
             raise HTTPException(status_code=404, detail="Shortened URL not found")
-        access_logs = (db.query(AccessLog)
-                       .join(URL, and_(AccessLog.url_id == URL.id)).filter(URL.shortened_url == full_url)
-                       .all())
-        logs = [{"timestamp": log.timestamp, "ip_address": log.ip_address} for log in access_logs]
-        return {
+        access_logs = db.execute(
+            select(AccessLog.timestamp, AccessLog.ip_address).where(AccessLog.url_id == url_entry.id)
+        ).all()
+        logs = [{"timestamp": timestamp, "ip_address": ip_address} for timestamp, ip_address in access_logs]
+        # Returning the response directly skips jsonable_encoder, so orjson serializes the datetimes itself
+        return ORJSONResponse({
             "original_url": url_entry.original_url,
             "access_count": url_entry.access_count,
             "access_logs": logs
-        }
+        })
     except Exception as e:
         print(e)
 
 @app.get("/", include_in_schema=False)
 def index():
-    resp = dict(
-        msg="ok",
-        jwks_config="/jwks"
-    )
-    return json.dumps(resp)
+    return {"msg": "ok", "jwks_config": "/jwks"}
 
 
 if __name__ == "__main__":